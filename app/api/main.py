@@ -1,7 +1,8 @@
 from fastapi import APIRouter
 
-from app.api.routes import job_router, ping_router
+from app.api.routes import artifact_router, job_router, ping_router
 
 api_router = APIRouter()
 api_router.include_router(ping_router.router, prefix="/ping", tags=["ping"])
 api_router.include_router(job_router.router, prefix="/jobs", tags=["jobs"])
+api_router.include_router(artifact_router.router, prefix="/artifacts", tags=["artifacts"])
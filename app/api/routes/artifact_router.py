@@ -0,0 +1,24 @@
+import logging
+
+from fastapi import APIRouter, status
+
+from app.schemas.artifact_schema import ArtifactStats
+from app.service.job_manager import JobManager
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+job_manager = JobManager()
+
+
+@router.get(
+    "",
+    response_model=ArtifactStats,
+    status_code=status.HTTP_200_OK,
+)
+async def get_artifact_stats() -> ArtifactStats:
+    """
+    Get the disk usage of artifacts, and the deletions and evictions made so far.
+    """
+    logger.debug("get_artifact_stats")
+
+    return await job_manager.artifacts.get_stats()
@@ -1,17 +1,25 @@
-import asyncio
 import logging
+import math
+from collections.abc import Callable
+from pathlib import Path
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException, Query, status
+from fastapi import APIRouter, Header, HTTPException, Query, Request, status
 from fastapi.responses import FileResponse
 
+from app.core.settings import settings
 from app.schemas.job_schema import Job, JobAcknowledgment, JobRequest, JobStatus
+from app.service.admission import AdmissionRejected
+from app.service.encoder import peaks_path, preview_path
 from app.service.job_manager import JobManager
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 job_manager = JobManager()
 
+# peaks and previews never change for a given job
+SIDECAR_CACHE_CONTROL = "private, max-age=86400, immutable"
+
 
 @router.get(
     "",
@@ -24,10 +32,7 @@ async def list_jobs(filter_status: JobStatus | None = None) -> list[Job]:
     """
     logger.debug("list_jobs")
 
-    jobs: list[Job] = list(job_manager.jobs.values())
-
-    if filter_status is not None:
-        jobs = [job for job in jobs if job.status == filter_status]
+    jobs = await job_manager.list_jobs(filter_status)
 
     return [Job.model_validate(job) for job in jobs]
 
@@ -37,18 +42,34 @@ async def list_jobs(filter_status: JobStatus | None = None) -> list[Job]:
     response_model=JobAcknowledgment,
     status_code=status.HTTP_202_ACCEPTED,
 )
-async def request_generation(request: JobRequest) -> JobAcknowledgment:
+async def request_generation(
+    request: JobRequest,
+    http_request: Request,
+    x_client_id: str | None = Header(default=None),
+) -> JobAcknowledgment:
     """
     Submit a new job for audio generation.
+
+    Jobs are rejected with 429 when the estimated GPU-seconds ahead of them exceed the queue
+    or per-client limits, with a Retry-After header estimating when they'd be accepted.
     """
     logger.debug("request_generation")
 
+    # callers could pick a fresh header per request, so it's only trusted when a proxy sets it
+    client_id = http_request.client.host if http_request.client else None
+    if settings.trust_client_id_header and x_client_id:
+        client_id = x_client_id
+
     try:
-        job_ack = await job_manager.submit_job(request)
+        job_ack = await job_manager.submit_job(request, client_id=client_id)
         return JobAcknowledgment.model_validate(job_ack)
-    except asyncio.QueueFull:
-        logger.error("Job queue is full")
-        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Queue is full")
+    except AdmissionRejected as e:
+        logger.error("Job rejected: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(max(math.ceil(e.retry_after_s), 1))},
+        )
 
 
 @router.get(
@@ -62,7 +83,7 @@ async def get_job_status(job_id: UUID) -> Job:
     """
     logger.debug("get_job_status")
 
-    job = job_manager.get_job(job_id)
+    job = await job_manager.get_job(job_id)
 
     if job is None:
         logger.error("Job not found with id=%s", job_id)
@@ -79,20 +100,75 @@ async def get_job_status(job_id: UUID) -> Job:
 async def download_job_artifact(job_id: UUID) -> FileResponse:
     """
     Download the output file for a completed job.
+    Supports HTTP range requests, so players can seek and downloads can resume.
     """
     logger.debug("download_job_artifact")
 
+    path = await _resolve_artifact(job_id)
+    await job_manager.mark_downloaded(job_id)
+
+    return FileResponse(
+        path=path,
+        media_type=f"audio/{path.suffix.lstrip('.')}",
+        filename=path.name,
+    )
+
+
+@router.get(
+    "/{job_id}/peaks",
+    response_class=FileResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def get_job_peaks(job_id: UUID) -> FileResponse:
+    """
+    Get the multi-resolution waveform peaks index for a completed job.
+    """
+    logger.debug("get_job_peaks")
+
+    path = await _resolve_artifact(job_id, peaks_path)
+
+    return FileResponse(
+        path=path,
+        media_type="application/json",
+        headers={"Cache-Control": SIDECAR_CACHE_CONTROL},
+    )
+
+
+@router.get(
+    "/{job_id}/preview",
+    response_class=FileResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def get_job_preview(job_id: UUID) -> FileResponse:
+    """
+    Get a short low-bitrate preview of a completed job.
+    """
+    logger.debug("get_job_preview")
+
+    path = await _resolve_artifact(job_id, preview_path)
+
+    return FileResponse(
+        path=path,
+        media_type="audio/mpeg",
+        headers={"Cache-Control": SIDECAR_CACHE_CONTROL},
+    )
+
+
+async def _resolve_artifact(job_id: UUID, sidecar: Callable[[Path], Path] | None = None) -> Path:
+    """
+    Resolve the output file of a completed job, or one of its sidecars, to an existing path.
+    """
+
     try:
-        path = job_manager.get_file_path_for_job(job_id)
+        path = await job_manager.get_file_path_for_job(job_id)
+
+        if sidecar is not None:
+            path = sidecar(path)
 
         if not path.exists():
             raise FileNotFoundError(f"No output file found for job id={job_id}")
 
-        return FileResponse(
-            path=path,
-            media_type=f"audio/{path.suffix.lstrip('.')}",
-            filename=path.name,
-        )
+        return path
     except KeyError as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.args[0])
     except ValueError as e:
@@ -115,7 +191,7 @@ async def cancel_job(job_id: UUID) -> None:
     logger.debug("cancel_job")
 
     try:
-        job_manager.cancel_job(job_id)
+        await job_manager.cancel_job(job_id)
     except KeyError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
     except ValueError as e:
@@ -138,8 +214,9 @@ async def clear_jobs(
     - status=QUEUED     -> cancel queued jobs
     - status=COMPLETED  -> delete completed jobs
     - status=FAILED     -> delete failed jobs
+    - status=EXPIRED    -> delete jobs whose artifact was evicted
     - no status         -> delete all except processing jobs
     """
     logger.warning("Clearing jobs with status=%s", status_filter)
 
-    job_manager.clear_jobs(status_filter)
+    await job_manager.clear_jobs(status_filter)
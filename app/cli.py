@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import click
+from pydantic import ValidationError
+from tqdm import tqdm
+
+from app.core.logger import configure_logging
+from app.core.settings import settings
+from app.schemas.manifest_schema import ManifestEntry
+from app.service.encoder import encode_audio
+
+if TYPE_CHECKING:
+    from app.service.engine import AudioEngine
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _RenderStats:
+    rendered: int = 0
+    skipped: int = 0
+    failed: int = 0
+    audio_s: float = 0.0
+    generation_s: float = 0.0
+    wall_s: float = 0.0
+
+
+@click.group()
+def main() -> None:
+    """
+    Melody Engine command line interface.
+    """
+    configure_logging()
+
+
+@main.command()
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=lambda: settings.render_output_dir,
+    show_default="render_output_dir setting",
+    help="Directory the rendered files are written to.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=lambda: settings.render_encode_workers,
+    show_default="render_encode_workers setting",
+    help="Number of processes encoding while the model keeps generating.",
+)
+@click.option("--overwrite", is_flag=True, help="Render entries even if their output already exists.")
+@click.option("--sidecars", is_flag=True, help="Also write the waveform peaks and preview of each output.")
+def render(manifest: Path, output_dir: Path, workers: int, overwrite: bool, sidecars: bool) -> None:
+    """
+    Render every entry of a JSONL MANIFEST back-to-back, without the HTTP API.
+
+    Each line is a JSON object with the same fields as a job request, plus an optional "output"
+    filename. Entries whose output already exists are skipped, so an interrupted run is resumed by
+    running the same command again.
+    """
+    entries = _read_manifest(manifest)
+    stats = _RenderStats()
+
+    todo: list[tuple[ManifestEntry, Path]] = []
+    seen: set[Path] = set()
+
+    for entry in entries:
+        out_path = output_dir / entry.output_name()
+
+        if out_path in seen or (out_path.exists() and not overwrite):
+            logger.info("Skipping existing output %s", out_path)
+            stats.skipped += 1
+            continue
+
+        seen.add(out_path)
+        todo.append((entry, out_path))
+
+    logger.info("Manifest has %d entries, %d to render", len(entries), len(todo))
+
+    if todo:
+        # imported here, so encoder processes re-importing this module never load MagentaRT
+        from app.service.engine import AudioEngine
+
+        engine = AudioEngine()
+        engine.load_magenta_rt_in_memory()
+
+        if not engine.is_loaded:
+            raise click.ClickException("MagentaRT could not be loaded.")
+
+        _render_all(engine, todo, workers, sidecars, stats)
+
+    _print_summary(stats)
+
+    if stats.failed:
+        sys.exit(1)
+
+
+@main.command()
+@click.option("--host", default=lambda: settings.app_host, show_default="app_host setting", help="Bind address.")
+@click.option("--port", type=int, default=lambda: settings.app_port, show_default="app_port setting", help="Bind port.")
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=lambda: settings.api_workers,
+    show_default="api_workers setting",
+    help="Number of API processes.",
+)
+def serve(host: str, port: int, workers: int) -> None:
+    """
+    Run the REST API and the generation worker.
+
+    With a single API process, the worker runs inside it as before. With more, one dedicated
+    worker process owns the model, and the stateless API processes share jobs with it through the
+    sqlite broker, so status polling and downloads scale across cores without touching the GPU.
+    """
+    import uvicorn
+
+    if workers == 1:
+        uvicorn.run("app.main:app", host=host, port=port, access_log=False)
+        return
+
+    if settings.broker == "memory":
+        logger.info("Switching to the sqlite broker to share jobs between %d API processes", workers)
+        os.environ["broker"] = "sqlite"  # noqa: SIM112 - settings are case sensitive
+
+    supervisor = _WorkerSupervisor()
+    supervisor.start()
+
+    # settings are read again by every API process, which must not load the model
+    os.environ["worker_enabled"] = "false"  # noqa: SIM112 - settings are case sensitive
+
+    try:
+        uvicorn.run("app.main:app", host=host, port=port, workers=workers, access_log=False)
+    finally:
+        supervisor.stop()
+
+
+@main.command()
+def worker() -> None:
+    """
+    Run only the generation worker, pulling jobs from the shared broker.
+    """
+    if settings.broker == "memory":
+        raise click.ClickException("The worker needs a shared broker, e.g. broker=sqlite.")
+    if not settings.worker_enabled:
+        raise click.ClickException("The worker is disabled by the worker_enabled setting.")
+
+    asyncio.run(_run_worker())
+
+
+async def _run_worker() -> None:
+    """
+    Runs the job manager's worker until SIGINT or SIGTERM.
+    """
+    from app.service.job_manager import JobManager
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    manager = JobManager()
+    await manager.start()
+    await stop.wait()
+    await manager.stop()
+
+
+class _WorkerSupervisor:
+    """
+    Keeps a generation worker process running next to the API processes.
+    """
+
+    def __init__(self) -> None:
+        self._process: subprocess.Popen | None = None
+        self._stopping = threading.Event()
+        # held while checking _stopping and starting a worker, so stop() can't miss a worker just started
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="worker-supervisor", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopping.set()
+            process = self._process
+
+        if process is not None and process.poll() is None:
+            logger.info("Stopping generation worker pid=%d", process.pid)
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        env = {**os.environ, "worker_enabled": "true"}
+
+        while True:
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+
+                # own session, so Ctrl-C only reaches the API processes and the worker is stopped by stop()
+                process = subprocess.Popen(
+                    [sys.executable, "-m", "app.cli", "worker"],
+                    env=env,
+                    start_new_session=True,
+                )
+                self._process = process
+
+            logger.info("Started generation worker pid=%d", process.pid)
+
+            code = process.wait()
+            if self._stopping.is_set():
+                return
+
+            # a clean exit means it was asked to stop, e.g. by a signal sent to it directly
+            if code == 0:
+                logger.info("Generation worker exited, not restarting it")
+                return
+
+            # jobs it held are redelivered to the restarted worker once their lease expires
+            logger.error("Generation worker exited with code=%d, restarting", code)
+            self._stopping.wait(5)
+
+
+def _read_manifest(path: Path) -> list[ManifestEntry]:
+    """
+    Parses a JSONL manifest, ignoring blank lines and lines starting with '#'.
+    """
+
+    entries: list[ManifestEntry] = []
+
+    with path.open(encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            try:
+                entries.append(ManifestEntry.model_validate_json(line))
+            except ValidationError as e:
+                raise click.ClickException(f"{path}:{lineno}: invalid manifest entry: {e}") from e
+
+    return entries
+
+
+def _render_all(
+    engine: AudioEngine,
+    todo: list[tuple[ManifestEntry, Path]],
+    workers: int,
+    sidecars: bool,
+    stats: _RenderStats,
+) -> None:
+    """
+    Generates on the model in this process, and overlaps encoding in a process pool.
+    """
+
+    # spawn, so the encoders never inherit the model or its device context, and only import this
+    # module and the encoder
+    mp_context = multiprocessing.get_context("spawn")
+    pending: dict[Future[Path], ManifestEntry] = {}
+    started = time.perf_counter()
+
+    with (
+        ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool,
+        tqdm(total=len(todo), unit="track") as progress,
+    ):
+        for entry, out_path in todo:
+            # at most one waveform per encoder in flight, so memory stays bounded on long renders
+            while len(pending) >= workers:
+                _collect(pending, stats, progress, FIRST_COMPLETED)
+
+            duration_ms = int(entry.duration_s * 1000)
+            generation_started = time.perf_counter()
+
+            try:
+                data, sr = engine.render_waveform(entry.prompt.strip(), duration_ms)
+            except Exception as e:
+                logger.error("Generation failed for %s: %s", out_path, e)
+                stats.failed += 1
+                progress.update()
+                continue
+
+            stats.generation_s += time.perf_counter() - generation_started
+
+            future = pool.submit(
+                encode_audio,
+                data,
+                sr,
+                str(out_path),
+                fmt=entry.format,
+                gain_db=entry.gain_db,
+                duration_ms=duration_ms,
+                sidecars=sidecars,
+            )
+            pending[future] = entry
+
+        _collect(pending, stats, progress, ALL_COMPLETED)
+
+    stats.wall_s = time.perf_counter() - started
+
+
+def _collect(
+    pending: dict[Future[Path], ManifestEntry],
+    stats: _RenderStats,
+    progress: tqdm,
+    return_when: str,
+) -> None:
+    """
+    Waits for in-flight encodes and records their outcome.
+    """
+
+    done, _ = wait(pending, return_when=return_when)
+
+    for future in done:
+        entry = pending.pop(future)
+
+        try:
+            out_path = future.result()
+        except Exception as e:
+            logger.error("Encoding failed for '%s': %s", entry.prompt, e)
+            stats.failed += 1
+        else:
+            logger.info("Rendered %s", out_path)
+            stats.rendered += 1
+            stats.audio_s += entry.duration_s
+
+        progress.update()
+
+
+def _print_summary(stats: _RenderStats) -> None:
+    click.echo(f"Rendered {stats.rendered}, skipped {stats.skipped}, failed {stats.failed}")
+
+    if stats.wall_s <= 0:
+        return
+
+    click.echo(
+        f"Audio {stats.audio_s:.1f}s in {stats.wall_s:.1f}s wall time "
+        f"({stats.generation_s:.1f}s generating), "
+        f"{stats.audio_s / stats.wall_s:.2f}x real-time, "
+        f"{stats.rendered * 60 / stats.wall_s:.2f} tracks/min"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import logging
+import os
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from app.core.settings import settings
+
+
+def configure_logging() -> None:
+    level = getattr(logging, settings.log_level.upper())
+    handlers: list[logging.Handler] = [logging.StreamHandler()]
+
+    if settings.log_file:
+        log_file = os.path.expandvars(str(settings.log_file))
+        log_file = str(Path(log_file).expanduser())
+
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+
+        file_handler = RotatingFileHandler(
+            log_file,
+            maxBytes=settings.log_file_max_size,
+            backupCount=settings.log_file_backup_count,
+        )
+        handlers.append(file_handler)
+
+    logging.basicConfig(
+        level=level,
+        format=settings.log_format,
+        handlers=handlers,
+        force=True,
+    )
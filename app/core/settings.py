@@ -18,6 +18,8 @@ class Settings(BaseSettings):
     # -------------------------------------------------------------------------
     app_host: str = "0.0.0.0"
     app_port: int = 8080
+    # API processes; above 1 the model runs in a separate generation worker process
+    api_workers: int = 1
     cors_origins: list[str] = ["*"]
 
     # -------------------------------------------------------------------------
@@ -26,10 +28,68 @@ class Settings(BaseSettings):
     output_dir: Path = Path("outputs")
     filename_trim_length: int = 50
 
+    # ------------------------------------------------------------------------
+    # PREVIEW SETTINGS
+    # ------------------------------------------------------------------------
+    preview_duration_s: float = 30.0
+    preview_bitrate: str = "64k"
+    # finest waveform peaks resolution in samples, coarsened further for long tracks
+    peaks_min_samples_per_peak: int = 256
+    # most peaks kept at the finest level, each coarser level keeps a quarter down to peaks_min_count
+    peaks_max_count: int = 65536
+    peaks_min_count: int = 256
+
+    # ------------------------------------------------------------------------
+    # ARTIFACT STORE SETTINGS
+    # ------------------------------------------------------------------------
+    # disk quota for artifacts in output_dir, least recently downloaded are evicted first, None for no quota
+    artifact_max_bytes: int | None = None
+    # artifacts not downloaded for this long are evicted, None to keep them forever
+    artifact_ttl_s: float | None = None
+    # how often artifacts are reconciled against the job table and evicted
+    artifact_sweep_interval_s: float = 300.0
+    # leftovers of interrupted encodes older than this are removed
+    artifact_stale_s: float = 3600.0
+    # downloads refresh the last use of an artifact at most this often
+    artifact_touch_interval_s: float = 60.0
+
+    # ------------------------------------------------------------------------
+    # BATCH RENDER SETTINGS
+    # ------------------------------------------------------------------------
+    render_output_dir: Path = Path("outputs") / "catalogue"
+    # number of processes encoding rendered waveforms while the model keeps generating
+    render_encode_workers: int = 2
+
     # ------------------------------------------------------------------------
     # INFERENCE QUEUE SETTINGS
     # ------------------------------------------------------------------------
     max_queue_size: int = 50
+    # cap on the estimated GPU-seconds of queued and processing work
+    max_queued_gpu_s: float = 24 * 3600
+    # cap per client address, None to disable
+    max_client_queued_gpu_s: float | None = None
+    # key the per-client cap on the X-Client-Id header instead, only behind a proxy that sets it
+    trust_client_id_header: bool = False
+    # generation seconds per second of audio, assumed until enough jobs have been measured
+    default_real_time_factor: float = 1.0
+    # number of recently completed jobs the real-time factor is measured over
+    real_time_factor_window: int = 20
+    # whether this process pulls jobs from the broker and runs the model
+    worker_enabled: bool = True
+
+    # ------------------------------------------------------------------------
+    # BROKER SETTINGS
+    # ------------------------------------------------------------------------
+    # broker can be memory (private to the process) or sqlite (shared through a file on a volume)
+    broker: str = "memory"
+    broker_sqlite_path: Path = Path("outputs") / ".jobs.sqlite3"
+    # a job is redelivered when its worker misses heartbeats for this long
+    broker_lease_s: float = 60.0
+    broker_heartbeat_s: float = 15.0
+    # how often an idle worker asks the broker for work
+    broker_poll_interval_s: float = 2.0
+    # deliveries of a job before it's failed, guards against jobs that crash their worker
+    broker_max_attempts: int = 3
 
     # ------------------------------------------------------------------------
     # MAGENTA RT SETTINGS
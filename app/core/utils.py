@@ -0,0 +1,14 @@
+import re
+
+from app.core.settings import settings
+
+
+def slugify(text: str) -> str:
+    """
+    Creates a URL-friendly slug of max length 50 from the given text.
+    """
+
+    text = text.lower()
+    text = re.sub(r"[^a-z0-9]+", "-", text)
+    max_len = settings.filename_trim_length
+    return text.strip("-")[:max_len]
@@ -1,9 +1,7 @@
 import logging
-import os
 import tomllib
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
-from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
 import setuptools_scm
@@ -11,35 +9,11 @@ from fastapi import FastAPI, staticfiles
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
+from app.core.logger import configure_logging
 from app.core.settings import settings
 from app.service.job_manager import JobManager
 
 
-def configure_logging() -> None:
-    level = getattr(logging, settings.log_level.upper())
-    handlers: list[logging.Handler] = [logging.StreamHandler()]
-
-    if settings.log_file:
-        log_file = os.path.expandvars(str(settings.log_file))
-        log_file = str(Path(log_file).expanduser())
-
-        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
-
-        file_handler = RotatingFileHandler(
-            log_file,
-            maxBytes=settings.log_file_max_size,
-            backupCount=settings.log_file_backup_count,
-        )
-        handlers.append(file_handler)
-
-    logging.basicConfig(
-        level=level,
-        format=settings.log_format,
-        handlers=handlers,
-        force=True,
-    )
-
-
 def get_project_metadata() -> dict[str, str]:
     pkg_version = setuptools_scm.get_version(root="..", relative_to=__file__)
 
@@ -67,11 +41,11 @@ async def lifespan(application: FastAPI) -> AsyncIterator[None]:
     logger.info("--------------------------------------------------------------------------------")
 
     manager = JobManager()
-    await manager.start_worker()
+    await manager.start()
 
     yield
 
-    await manager.stop_worker()
+    await manager.stop()
 
     logger.info("--------------------------------------------------------------------------------")
     logger.info("Shutting down application")
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+
+class ArtifactStats(BaseModel):
+    artifact_count: int = Field(..., description="Artifacts in the output directory")
+    artifact_bytes: int = Field(..., description="Disk used by artifacts, including peaks and previews")
+    max_bytes: int | None = Field(None, description="Disk quota for artifacts")
+    ttl_s: float | None = Field(None, description="Time an artifact is kept after its last download")
+    free_bytes: int = Field(..., description="Free space on the output volume")
+    deleted_files: int = Field(..., description="Files deleted so far")
+    freed_bytes: int = Field(..., description="Bytes freed so far")
+    evicted_ttl: int = Field(..., description="Artifacts evicted so far for exceeding the TTL")
+    evicted_quota: int = Field(..., description="Artifacts evicted so far to stay within the quota")
+    missing: int = Field(..., description="Completed jobs found without their artifact so far")
+    last_sweep_at: datetime | None = Field(None, description="Last reconciliation run")
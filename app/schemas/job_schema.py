@@ -14,6 +14,7 @@ class JobStatus(StrEnum):
     PROCESSING = "PROCESSING"
     COMPLETED = "COMPLETED"
     FAILED = "FAILED"
+    EXPIRED = "EXPIRED"
 
 
 class JobRequest(BaseModel):
@@ -39,6 +40,9 @@ class Job(_FromORM):
     status: JobStatus = Field(..., description="Job status")
     output_name: str | None = Field(None, description="Filename of the generated audio")
     message: str | None = Field(None, description="Other details")
+    started_at: datetime | None = Field(default=None, description="Processing start timestamp")
+    completed_at: datetime | None = Field(default=None, description="Processing end timestamp")
+    downloaded_at: datetime | None = Field(default=None, description="Last download timestamp")
 
     @classmethod
     def from_request(
@@ -0,0 +1,47 @@
+import hashlib
+from pathlib import PurePath
+from typing import Self
+
+from pydantic import Field, model_validator
+
+from app.core.utils import slugify
+from app.schemas.job_schema import JobRequest
+
+
+class ManifestEntry(JobRequest):
+    output: str | None = Field(None, min_length=1, description="Output filename, relative to the output directory")
+
+    @model_validator(mode="after")
+    def check_output(self) -> Self:
+        """
+        Keeps the output inside the output directory, and its extension in line with the format.
+        Without an explicit format, it's taken from the extension.
+        """
+        if self.output is None:
+            return self
+
+        path = PurePath(self.output)
+        if path.is_absolute() or ".." in path.parts:
+            raise ValueError("output must be a relative path inside the output directory")
+
+        suffix = path.suffix.removeprefix(".").lower()
+        if "format" not in self.model_fields_set and suffix in ("wav", "flac", "mp3"):
+            self.format = suffix
+        elif suffix != self.format:
+            raise ValueError(f"output extension must be .{self.format} to match the format")
+
+        return self
+
+    def output_name(self) -> str:
+        """
+        Returns the output filename for this entry.
+
+        Without an explicit output, the name is derived from the entry itself, so re-running the same
+        manifest maps every entry to the same file.
+        """
+        if self.output:
+            return self.output
+
+        key = self.model_dump_json(include={"prompt", "duration_s", "gain_db", "format"})
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+        return f"{slugify(self.prompt)}-{digest}.{self.format}"
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from app.core.settings import settings
+from app.schemas.job_schema import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a job doesn't fit in the queue, with an estimate of when it would.
+    """
+
+    def __init__(self, reason: str, retry_after_s: float) -> None:
+        super().__init__(reason)
+        self.retry_after_s = retry_after_s
+
+
+@dataclass
+class ActiveJob:
+    """
+    A queued or processing job, with who submitted it and which worker holds it.
+    """
+
+    job: Job
+    client_id: str | None = None
+    worker_id: str | None = None
+
+
+def admit(job: Job, client_id: str | None, active: list[ActiveJob], completed: list[Job]) -> None:
+    """
+    Rejects a job if the queue is full, or if the estimated GPU-seconds ahead of it would exceed
+    the configured caps. Brokers call this in the same transaction that adds the job, given the
+    queued and processing jobs, and the most recently completed ones to measure speed on.
+
+    A job larger than a cap on its own is still admitted once nothing is ahead of it, so the
+    retry hint is the time until enough of the backlog drains, and never more than all of it.
+    """
+
+    rtf = real_time_factor(completed)
+
+    if sum(1 for entry in active if entry.job.status == JobStatus.QUEUED) >= settings.max_queue_size:
+        remaining = [_remaining_gpu_s(entry.job, rtf) for entry in active if entry.job.status == JobStatus.PROCESSING]
+        raise AdmissionRejected("Queue is full", min(remaining, default=settings.broker_poll_interval_s))
+
+    # each worker generating drains one GPU-second per second
+    drain_rate = max(len({entry.worker_id for entry in active if entry.job.status == JobStatus.PROCESSING}), 1)
+    cost = job.duration_s * rtf
+
+    backlog = sum(_remaining_gpu_s(entry.job, rtf) for entry in active)
+    limit = settings.max_queued_gpu_s
+    if backlog > 0 and backlog + cost > limit:
+        logger.warning("Rejecting job: %.0f GPU-s queued, %.0f requested, limit %.0f", backlog, cost, limit)
+        raise AdmissionRejected("Queue is full", min(backlog + cost - limit, backlog) / drain_rate)
+
+    limit_client = settings.max_client_queued_gpu_s
+    if limit_client is None or client_id is None:
+        return
+
+    backlog = sum(_remaining_gpu_s(entry.job, rtf) for entry in active if entry.client_id == client_id)
+    if backlog > 0 and backlog + cost > limit_client:
+        logger.warning(
+            "Rejecting job from client=%s: %.0f GPU-s queued, %.0f requested, quota %.0f",
+            client_id,
+            backlog,
+            cost,
+            limit_client,
+        )
+        raise AdmissionRejected("Client quota exceeded", min(backlog + cost - limit_client, backlog) / drain_rate)
+
+
+def real_time_factor(completed: list[Job]) -> float:
+    """
+    Measures generation seconds per second of audio over completed jobs.
+    """
+
+    measured = [job for job in completed if job.started_at and job.completed_at]
+
+    audio_s = sum(job.duration_s for job in measured)
+    if not audio_s:
+        return settings.default_real_time_factor
+
+    elapsed_s = sum(
+        (job.completed_at - job.started_at).total_seconds() for job in measured if job.completed_at and job.started_at
+    )
+    return elapsed_s / audio_s
+
+
+def _remaining_gpu_s(job: Job, rtf: float) -> float:
+    """
+    Estimates the GPU-seconds needed to finish a queued or processing job.
+    """
+
+    if job.status == JobStatus.QUEUED:
+        return job.duration_s * rtf
+    if job.status == JobStatus.PROCESSING and job.started_at:
+        elapsed_s = (datetime.now(UTC) - job.started_at).total_seconds()
+        return max(job.duration_s * rtf - elapsed_s, 0.0)
+    return 0.0
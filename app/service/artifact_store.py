@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import shutil
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+
+from app.core.settings import settings
+from app.schemas.artifact_schema import ArtifactStats
+from app.schemas.job_schema import Job, JobStatus
+from app.service.broker import Broker
+from app.service.encoder import PEAKS_SUFFIX, PREVIEW_SUFFIX, SUPPORTED_FORMATS, peaks_path, preview_path
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _File:
+    size: int
+    mtime: float
+
+
+@dataclass
+class _Artifact:
+    path: Path
+    size: int
+    last_used: float
+    job: Job | None
+
+
+class ArtifactStore:
+    """
+    Owns the artifacts in the output directory.
+
+    Files are deleted by a background task, off the event loop. A periodic sweep reconciles the job
+    table with the files on disk, removes leftovers of interrupted encodes, and evicts artifacts
+    past the TTL or, least recently downloaded first, beyond the disk quota. Artifacts that no job
+    knows about, e.g. after a restart with the memory broker, age by their modification time.
+
+    Deletion and eviction counts are kept as broker counters, so every process reports the same
+    figures, whichever of them swept or deleted. Several nodes may sweep the same artifact, so an
+    eviction is only counted by the node whose expiry or deletion actually went through.
+    """
+
+    def __init__(self, broker: Broker) -> None:
+        self.broker = broker
+        self.output_dir = Path(settings.output_dir)
+        # files to delete, with the counter to bump if this process is the one deleting them
+        self._deletions: asyncio.Queue[tuple[Path, str | None]] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self, sweep: bool = True) -> None:
+        """
+        Starts the background deletion task, and optionally the periodic sweep.
+        """
+
+        # the stats measure the volume through this directory, which only appears with the first artifact otherwise
+        await asyncio.to_thread(self.output_dir.mkdir, parents=True, exist_ok=True)
+
+        self._tasks.append(asyncio.create_task(self._deleter()))
+
+        if sweep:
+            logger.info(
+                "Sweeping artifacts every %ss (max_bytes=%s, ttl_s=%s)",
+                settings.artifact_sweep_interval_s,
+                settings.artifact_max_bytes,
+                settings.artifact_ttl_s,
+            )
+            self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self) -> None:
+        """
+        Stops the background tasks, after deleting whatever is already queued.
+        """
+
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._deletions.join(), timeout=10)
+
+        for task in self._tasks:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+        self._tasks.clear()
+
+    def discard(self, output_name: str, counter: str | None = None) -> None:
+        """
+        Queues an artifact and its peaks index and preview for deletion.
+        The counter, if any, is bumped once the artifact itself is deleted.
+        """
+
+        path = self.output_dir / output_name
+        self._deletions.put_nowait((path, counter))
+        for sidecar in (peaks_path(path), preview_path(path)):
+            self._deletions.put_nowait((sidecar, None))
+
+    async def get_stats(self) -> ArtifactStats:
+        """
+        Reports the current disk usage, and what has been deleted so far.
+        """
+
+        files = await asyncio.to_thread(self._scan)
+        usage = await asyncio.to_thread(shutil.disk_usage, self.output_dir)
+        counters = await asyncio.to_thread(self.broker.get_counters)
+        last_sweep_at = counters.get("last_sweep_at")
+
+        return ArtifactStats(
+            artifact_count=sum(1 for name in files if self._is_artifact(name)),
+            artifact_bytes=sum(
+                f.size for name, f in files.items() if self._is_artifact(name) or self._is_sidecar(name)
+            ),
+            max_bytes=settings.artifact_max_bytes,
+            ttl_s=settings.artifact_ttl_s,
+            free_bytes=usage.free,
+            deleted_files=int(counters.get("deleted_files", 0)),
+            freed_bytes=int(counters.get("freed_bytes", 0)),
+            evicted_ttl=int(counters.get("evicted_ttl", 0)),
+            evicted_quota=int(counters.get("evicted_quota", 0)),
+            missing=int(counters.get("missing", 0)),
+            last_sweep_at=datetime.fromtimestamp(last_sweep_at, UTC) if last_sweep_at else None,
+        )
+
+    async def sweep(self) -> None:
+        """
+        Reconciles the job table with the files on disk, and evicts artifacts per the retention policy.
+        """
+
+        jobs = await asyncio.to_thread(self.broker.list_jobs)
+        files = await asyncio.to_thread(self._scan)
+        now = time.time()
+
+        completed = {job.output_name: job for job in jobs if job.status == JobStatus.COMPLETED and job.output_name}
+        missing = evicted_ttl = evicted_quota = 0
+
+        # completed jobs whose artifact disappeared
+        for name, job in completed.items():
+            if name not in files:
+                logger.warning("Artifact %s of job id=%s is missing", name, job.id)
+                if await self._expire(job, "Artifact missing from disk"):
+                    missing += 1
+
+        # leftovers of interrupted encodes, and sidecars of removed artifacts
+        for name in files:
+            if self._is_leftover(name, files, now):
+                self._deletions.put_nowait((self.output_dir / name, None))
+
+        # artifacts of expired jobs whose deletion didn't go through
+        expired = {job.output_name for job in jobs if job.status == JobStatus.EXPIRED and job.output_name}
+        for name in expired & files.keys():
+            self.discard(name)
+
+        artifacts: list[_Artifact] = []
+        for name, f in files.items():
+            if not self._is_artifact(name) or name in expired:
+                continue
+
+            path = self.output_dir / name
+            sidecars = (files.get(peaks_path(path).name), files.get(preview_path(path).name))
+            size = f.size + sum(s.size for s in sidecars if s is not None)
+
+            owner = completed.get(name)
+            if owner is not None:
+                last_used = (owner.downloaded_at or owner.completed_at or owner.created_at).timestamp()
+            else:
+                last_used = f.mtime
+
+            artifacts.append(_Artifact(path=path, size=size, last_used=last_used, job=owner))
+
+        artifacts.sort(key=lambda artifact: artifact.last_used)
+        total = sum(artifact.size for artifact in artifacts)
+
+        evicted = 0
+
+        for artifact in artifacts:
+            if settings.artifact_ttl_s is not None and now - artifact.last_used > settings.artifact_ttl_s:
+                evicted_ttl += await self._evict(artifact, "Artifact expired", "evicted_ttl")
+            elif settings.artifact_max_bytes is not None and total > settings.artifact_max_bytes:
+                evicted_quota += await self._evict(
+                    artifact, "Artifact evicted to stay within the disk quota", "evicted_quota"
+                )
+            else:
+                continue
+
+            total -= artifact.size
+            evicted += 1
+
+        await asyncio.to_thread(
+            self.broker.add_counters,
+            {"missing": missing, "evicted_ttl": evicted_ttl, "evicted_quota": evicted_quota},
+        )
+        await asyncio.to_thread(self.broker.set_counters, {"last_sweep_at": time.time()})
+
+        logger.info(
+            "Artifacts use %d bytes in %d files (max_bytes=%s), evicted %d",
+            total,
+            len(artifacts) - evicted,
+            settings.artifact_max_bytes,
+            evicted,
+        )
+
+    async def _evict(self, artifact: _Artifact, reason: str, counter: str) -> bool:
+        """
+        Deletes an artifact and expires its job.
+        Returns whether the eviction is to be counted now, i.e. this call expired the job. Artifacts
+        without a job are counted by the deleter instead, once their file is actually gone.
+        """
+        logger.info("Evicting %s: %s", artifact.path.name, reason)
+
+        if artifact.job is None:
+            self.discard(artifact.path.name, counter)
+            return False
+
+        self.discard(artifact.path.name)
+        return await self._expire(artifact.job, reason)
+
+    async def _expire(self, job: Job, reason: str) -> bool:
+        return await asyncio.to_thread(self.broker.expire, job.id, reason)
+
+    async def _sweeper(self) -> None:
+        """
+        Infinite loop sweeping the output directory.
+        """
+
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error("Unexpected error while sweeping artifacts: %s", e)
+
+            await asyncio.sleep(settings.artifact_sweep_interval_s)
+
+    async def _deleter(self) -> None:
+        """
+        Infinite loop deleting queued files.
+        """
+
+        while True:
+            path, counter = await self._deletions.get()
+
+            try:
+                size = await asyncio.to_thread(self._unlink, path)
+                if size is not None:
+                    counters: dict[str, float] = {"deleted_files": 1, "freed_bytes": size}
+                    if counter is not None:
+                        counters[counter] = 1
+                    await asyncio.to_thread(self.broker.add_counters, counters)
+            except Exception as e:
+                logger.error("Failed to delete %s: %s", path, e)
+            finally:
+                self._deletions.task_done()
+
+    @staticmethod
+    def _unlink(path: Path) -> int | None:
+        """
+        Deletes a file, returning its size, or None if it was already gone.
+        """
+
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return None
+
+        logger.debug("Deleted %s", path)
+        return size
+
+    def _scan(self) -> dict[str, _File]:
+        """
+        Lists the files directly in the output directory. Subdirectories, like batch renders, are left alone.
+        """
+
+        files: dict[str, _File] = {}
+
+        if not self.output_dir.is_dir():
+            return files
+
+        for path in self.output_dir.iterdir():
+            with contextlib.suppress(FileNotFoundError):
+                stat = path.stat()
+                if path.is_file():
+                    files[path.name] = _File(size=stat.st_size, mtime=stat.st_mtime)
+
+        return files
+
+    @staticmethod
+    def _is_artifact(name: str) -> bool:
+        """
+        Whether the file is a finished artifact, as opposed to a sidecar or a temporary file.
+        """
+
+        return (
+            not name.startswith(".")
+            and not name.endswith((".tmp.wav", PREVIEW_SUFFIX))
+            and name.rsplit(".", 1)[-1] in SUPPORTED_FORMATS
+        )
+
+    @staticmethod
+    def _is_sidecar(name: str) -> bool:
+        """
+        Whether the file is the peaks index or preview of an artifact.
+        """
+
+        return not name.startswith(".") and name.endswith((PEAKS_SUFFIX, PREVIEW_SUFFIX))
+
+    @staticmethod
+    def _is_leftover(name: str, files: dict[str, _File], now: float | None) -> bool:
+        """
+        Whether the file is a partial or temporary file, or a sidecar without its artifact.
+        With a time given, only files untouched for artifact_stale_s count.
+        """
+
+        if (name.startswith(".") and ".partial." in name) or name.endswith(".tmp.wav"):
+            leftover = True
+        elif ArtifactStore._is_sidecar(name):
+            stem = name.removesuffix(PEAKS_SUFFIX).removesuffix(PREVIEW_SUFFIX)
+            leftover = not any(f"{stem}.{fmt}" in files for fmt in SUPPORTED_FORMATS)
+        else:
+            return False
+
+        return leftover and (now is None or now - files[name].mtime > settings.artifact_stale_s)
@@ -0,0 +1,519 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from uuid import UUID
+
+from app.core.settings import settings
+from app.schemas.job_schema import Job, JobStatus
+from app.service.admission import ActiveJob, admit
+
+logger = logging.getLogger(__name__)
+
+
+class Broker(ABC):
+    """
+    Job table and work queue shared by the API and the generation workers.
+
+    A worker leases the oldest queued job, keeps the lease alive with heartbeats while generating,
+    and finishes it with the final job state. A lease that isn't renewed in time means the worker
+    died, and the job is delivered to the next worker asking for work.
+
+    Every method is blocking and safe to call from any thread, so callers on the event loop should
+    go through asyncio.to_thread. Implementations that share state between processes (sqlite, or a
+    Redis-style server) let any node accept submissions and any idle worker pull them.
+    """
+
+    @abstractmethod
+    def put(self, job: Job, client_id: str | None = None) -> None:
+        """
+        Adds a queued job, atomically with the admission check.
+        The submitting client is kept by the broker for per-client quotas, not in the job itself.
+        Raises AdmissionRejected if the queue can't take it.
+        """
+
+    @abstractmethod
+    def get(self, job_id: UUID) -> Job | None:
+        """
+        Retrieves a job by ID.
+        """
+
+    @abstractmethod
+    def list_jobs(self, status: JobStatus | None = None) -> list[Job]:
+        """
+        Lists jobs in submission order, optionally filtered by status.
+        """
+
+    @abstractmethod
+    def touch(self, job_id: UUID, downloaded_at: datetime) -> bool:
+        """
+        Records the last download of a completed job's artifact.
+        Returns False if the job is no longer completed, e.g. expired meanwhile.
+        """
+
+    @abstractmethod
+    def expire(self, job_id: UUID, message: str) -> bool:
+        """
+        Marks a completed job as expired, once its artifact is gone.
+        Returns False if the job is no longer completed.
+        """
+
+    @abstractmethod
+    def delete(self, job_id: UUID) -> bool:
+        """
+        Deletes a job unless it's being processed.
+        Returns whether the job was deleted.
+        """
+
+    @abstractmethod
+    def lease(self, worker_id: str) -> Job | None:
+        """
+        Hands the next job to a worker and marks it as processing.
+        Jobs whose lease expired are redelivered first, or failed once out of attempts.
+        """
+
+    @abstractmethod
+    def heartbeat(self, job_id: UUID, worker_id: str) -> bool:
+        """
+        Extends the lease on a job.
+        Returns False if the worker no longer holds the lease.
+        """
+
+    @abstractmethod
+    def requeue(self, job_id: UUID, worker_id: str) -> bool:
+        """
+        Gives a leased job back to the queue without counting it as an attempt.
+        """
+
+    @abstractmethod
+    def finish(self, job: Job, worker_id: str) -> bool:
+        """
+        Stores the final state of a leased job and releases the lease.
+        Returns False if the worker no longer holds the lease, in which case nothing is stored.
+        """
+
+    @abstractmethod
+    def add_counters(self, deltas: dict[str, float]) -> None:
+        """
+        Adds to named counters, shared like the jobs, so any process can report them.
+        """
+
+    @abstractmethod
+    def set_counters(self, values: dict[str, float]) -> None:
+        """
+        Overwrites named counters.
+        """
+
+    @abstractmethod
+    def get_counters(self) -> dict[str, float]:
+        """
+        Retrieves every counter.
+        """
+
+    def close(self) -> None:
+        """
+        Releases any resources held by the broker.
+        """
+
+
+@dataclass
+class _Lease:
+    owner: str | None = None
+    expires_at: float = 0.0
+    attempts: int = 0
+    client_id: str | None = None
+
+
+class MemoryBroker(Broker):
+    """
+    Broker private to this process, matching the behaviour of a plain in-process queue.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._jobs: dict[UUID, Job] = {}
+        self._leases: dict[UUID, _Lease] = {}
+        self._counters: dict[str, float] = {}
+
+    def put(self, job: Job, client_id: str | None = None) -> None:
+        with self._lock:
+            active = [
+                ActiveJob(j, self._leases[j.id].client_id, self._leases[j.id].owner)
+                for j in self._jobs.values()
+                if j.status in (JobStatus.QUEUED, JobStatus.PROCESSING)
+            ]
+            completed = sorted(
+                (j for j in self._jobs.values() if j.status == JobStatus.COMPLETED),
+                key=lambda j: j.completed_at or j.created_at,
+            )[-settings.real_time_factor_window :]
+            admit(job, client_id, active, completed)
+
+            self._jobs[job.id] = job.model_copy()
+            self._leases[job.id] = _Lease(client_id=client_id)
+
+    def get(self, job_id: UUID) -> Job | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.model_copy() if job else None
+
+    def list_jobs(self, status: JobStatus | None = None) -> list[Job]:
+        with self._lock:
+            return [job.model_copy() for job in self._jobs.values() if status is None or job.status == status]
+
+    def touch(self, job_id: UUID, downloaded_at: datetime) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JobStatus.COMPLETED:
+                return False
+
+            job.downloaded_at = downloaded_at
+            return True
+
+    def expire(self, job_id: UUID, message: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JobStatus.COMPLETED:
+                return False
+
+            job.status = JobStatus.EXPIRED
+            job.message = message
+            return True
+
+    def delete(self, job_id: UUID) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status == JobStatus.PROCESSING:
+                return False
+
+            del self._jobs[job_id]
+            del self._leases[job_id]
+            return True
+
+    def lease(self, worker_id: str) -> Job | None:
+        now = time.time()
+
+        with self._lock:
+            for job in self._jobs.values():
+                lease = self._leases[job.id]
+
+                if job.status == JobStatus.PROCESSING and lease.expires_at < now:
+                    logger.warning("Lease on job id=%s held by %s expired", job.id, lease.owner)
+                    if lease.attempts >= settings.broker_max_attempts:
+                        job.status = JobStatus.FAILED
+                        job.message = f"Worker lost after {lease.attempts} attempts"
+                        job.completed_at = datetime.now(UTC)
+                        lease.owner = None
+                        continue
+                elif job.status != JobStatus.QUEUED:
+                    continue
+
+                job.status = JobStatus.PROCESSING
+                job.started_at = datetime.now(UTC)
+                lease.owner = worker_id
+                lease.expires_at = now + settings.broker_lease_s
+                lease.attempts += 1
+                return job.model_copy()
+
+        return None
+
+    def heartbeat(self, job_id: UUID, worker_id: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(job_id)
+            if lease is None or lease.owner != worker_id:
+                return False
+
+            lease.expires_at = time.time() + settings.broker_lease_s
+            return True
+
+    def requeue(self, job_id: UUID, worker_id: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(job_id)
+            if lease is None or lease.owner != worker_id:
+                return False
+
+            job = self._jobs[job_id]
+            job.status = JobStatus.QUEUED
+            job.started_at = None
+            lease.owner = None
+            lease.attempts -= 1
+            return True
+
+    def finish(self, job: Job, worker_id: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(job.id)
+            if lease is None or lease.owner != worker_id:
+                return False
+
+            self._jobs[job.id] = job.model_copy()
+            lease.owner = None
+            return True
+
+    def add_counters(self, deltas: dict[str, float]) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                self._counters[name] = self._counters.get(name, 0.0) + delta
+
+    def set_counters(self, values: dict[str, float]) -> None:
+        with self._lock:
+            self._counters.update(values)
+
+    def get_counters(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+
+class SQLiteBroker(Broker):
+    """
+    Broker backed by a sqlite database, shared by every process that opens the same file.
+
+    Writes take the database lock up front (BEGIN IMMEDIATE), so two workers can never lease the
+    same job. The database must live on a filesystem with working POSIX locks, e.g. a volume
+    mounted into several containers on the same host.
+    """
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+        with self._transaction() as cur:
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    completed_at TEXT,
+                    client_id TEXT,
+                    lease_owner TEXT,
+                    lease_expires_at REAL NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at)")
+            cur.execute("CREATE INDEX IF NOT EXISTS jobs_status_completed_at ON jobs (status, completed_at)")
+            cur.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+
+        logger.info("Using sqlite broker at %s", path)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            else:
+                cur.execute("COMMIT")
+            finally:
+                cur.close()
+
+    def _query(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _store(cur: sqlite3.Cursor, job: Job) -> None:
+        cur.execute(
+            "UPDATE jobs SET status = ?, completed_at = ?, payload = ? WHERE id = ?",
+            (job.status.value, _timestamp(job.completed_at), job.model_dump_json(), str(job.id)),
+        )
+
+    def put(self, job: Job, client_id: str | None = None) -> None:
+        with self._transaction() as cur:
+            # only the active jobs and the latest completed ones, the history can be long
+            rows = cur.execute(
+                "SELECT payload, client_id, lease_owner FROM jobs WHERE status IN (?, ?)",
+                (JobStatus.QUEUED.value, JobStatus.PROCESSING.value),
+            ).fetchall()
+            active = [ActiveJob(Job.model_validate_json(payload), client, owner) for payload, client, owner in rows]
+
+            rows = cur.execute(
+                "SELECT payload FROM jobs WHERE status = ? ORDER BY completed_at DESC LIMIT ?",
+                (JobStatus.COMPLETED.value, settings.real_time_factor_window),
+            ).fetchall()
+            admit(job, client_id, active, [Job.model_validate_json(p) for (p,) in rows])
+
+            cur.execute(
+                "INSERT INTO jobs (id, status, created_at, payload, client_id) VALUES (?, ?, ?, ?, ?)",
+                (str(job.id), job.status.value, job.created_at.isoformat(), job.model_dump_json(), client_id),
+            )
+
+    def get(self, job_id: UUID) -> Job | None:
+        rows = self._query("SELECT payload FROM jobs WHERE id = ?", (str(job_id),))
+        return Job.model_validate_json(rows[0][0]) if rows else None
+
+    def list_jobs(self, status: JobStatus | None = None) -> list[Job]:
+        if status is None:
+            rows = self._query("SELECT payload FROM jobs ORDER BY created_at")
+        else:
+            rows = self._query("SELECT payload FROM jobs WHERE status = ? ORDER BY created_at", (status.value,))
+        return [Job.model_validate_json(payload) for (payload,) in rows]
+
+    def touch(self, job_id: UUID, downloaded_at: datetime) -> bool:
+        # patch the field in place, a full payload read earlier could overwrite a concurrent expiry
+        with self._transaction() as cur:
+            cur.execute(
+                "UPDATE jobs SET payload = json_set(payload, '$.downloaded_at', ?) WHERE id = ? AND status = ?",
+                (downloaded_at.isoformat(), str(job_id), JobStatus.COMPLETED.value),
+            )
+            return cur.rowcount > 0
+
+    def expire(self, job_id: UUID, message: str) -> bool:
+        with self._transaction() as cur:
+            cur.execute(
+                "UPDATE jobs SET status = ?, payload = json_set(payload, '$.status', ?, '$.message', ?) "
+                "WHERE id = ? AND status = ?",
+                (
+                    JobStatus.EXPIRED.value,
+                    JobStatus.EXPIRED.value,
+                    message,
+                    str(job_id),
+                    JobStatus.COMPLETED.value,
+                ),
+            )
+            return cur.rowcount > 0
+
+    def delete(self, job_id: UUID) -> bool:
+        with self._transaction() as cur:
+            cur.execute(
+                "DELETE FROM jobs WHERE id = ? AND status != ?",
+                (str(job_id), JobStatus.PROCESSING.value),
+            )
+            return cur.rowcount > 0
+
+    def lease(self, worker_id: str) -> Job | None:
+        now = time.time()
+
+        with self._transaction() as cur:
+            expired = cur.execute(
+                "SELECT payload, lease_owner, attempts FROM jobs "
+                "WHERE status = ? AND lease_expires_at < ? ORDER BY created_at",
+                (JobStatus.PROCESSING.value, now),
+            ).fetchall()
+
+            for payload, owner, attempts in expired:
+                job = Job.model_validate_json(payload)
+                logger.warning("Lease on job id=%s held by %s expired", job.id, owner)
+
+                if attempts < settings.broker_max_attempts:
+                    break
+
+                job.status = JobStatus.FAILED
+                job.message = f"Worker lost after {attempts} attempts"
+                job.completed_at = datetime.now(UTC)
+                self._store(cur, job)
+                cur.execute("UPDATE jobs SET lease_owner = NULL WHERE id = ?", (str(job.id),))
+            else:
+                row = cur.execute(
+                    "SELECT payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (JobStatus.QUEUED.value,),
+                ).fetchone()
+                if row is None:
+                    return None
+                job = Job.model_validate_json(row[0])
+
+            job.status = JobStatus.PROCESSING
+            job.started_at = datetime.now(UTC)
+            self._store(cur, job)
+            cur.execute(
+                "UPDATE jobs SET lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now + settings.broker_lease_s, str(job.id)),
+            )
+            return job
+
+    def heartbeat(self, job_id: UUID, worker_id: str) -> bool:
+        with self._transaction() as cur:
+            cur.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND lease_owner = ?",
+                (time.time() + settings.broker_lease_s, str(job_id), worker_id),
+            )
+            return cur.rowcount > 0
+
+    def requeue(self, job_id: UUID, worker_id: str) -> bool:
+        with self._transaction() as cur:
+            row = cur.execute(
+                "SELECT payload FROM jobs WHERE id = ? AND lease_owner = ?",
+                (str(job_id), worker_id),
+            ).fetchone()
+            if row is None:
+                return False
+
+            job = Job.model_validate_json(row[0])
+            job.status = JobStatus.QUEUED
+            job.started_at = None
+            self._store(cur, job)
+            cur.execute(
+                "UPDATE jobs SET lease_owner = NULL, attempts = attempts - 1 WHERE id = ?",
+                (str(job_id),),
+            )
+            return True
+
+    def finish(self, job: Job, worker_id: str) -> bool:
+        with self._transaction() as cur:
+            cur.execute(
+                "UPDATE jobs SET status = ?, completed_at = ?, payload = ?, lease_owner = NULL "
+                "WHERE id = ? AND lease_owner = ?",
+                (job.status.value, _timestamp(job.completed_at), job.model_dump_json(), str(job.id), worker_id),
+            )
+            return cur.rowcount > 0
+
+    def add_counters(self, deltas: dict[str, float]) -> None:
+        with self._transaction() as cur:
+            cur.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                deltas.items(),
+            )
+
+    def set_counters(self, values: dict[str, float]) -> None:
+        with self._transaction() as cur:
+            cur.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                values.items(),
+            )
+
+    def get_counters(self) -> dict[str, float]:
+        return {str(name): float(value) for name, value in self._query("SELECT name, value FROM counters")}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _timestamp(value: datetime | None) -> str | None:
+    """
+    Formats a timestamp for a sqlite column, in UTC so that columns sort in time order.
+    """
+
+    return value.astimezone(UTC).isoformat() if value else None
+
+
+def create_broker() -> Broker:
+    """
+    Creates the broker selected by the broker setting.
+    """
+
+    if settings.broker == "memory":
+        return MemoryBroker()
+    if settings.broker == "sqlite":
+        return SQLiteBroker(settings.broker_sqlite_path)
+
+    raise ValueError(f"Unsupported broker: {settings.broker}")
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import uuid
+from pathlib import Path
+from typing import cast
+
+import numpy as np
+import soundfile as sf
+from pydub import AudioSegment
+
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FORMATS = ("wav", "flac", "mp3")
+PEAKS_SUFFIX = ".peaks.json"
+PREVIEW_SUFFIX = ".preview.mp3"
+
+
+def encode_audio(
+    data: np.ndarray,
+    sr: int,
+    out_path: str,
+    fmt: str = "wav",
+    gain_db: float = 0.0,
+    duration_ms: int | None = None,
+    sidecars: bool = True,
+) -> Path:
+    """
+    Post-processes a rendered waveform and encodes it to disk.
+
+    Unless disabled, a waveform peaks index and a short low-bitrate preview are written next to
+    the output, before the output itself appears.
+
+    This module deliberately doesn't import MagentaRT, so it can run in a
+    separate process without loading the model.
+
+    Args:
+        data: The rendered samples, shaped (frames, channels).
+        sr: The sample rate of the samples.
+        out_path: The path to save the encoded audio to.
+        fmt: The format of the encoded audio ("wav", "flac", "mp3").
+        gain_db: The gain to apply in decibels.
+        duration_ms: The exact duration to trim to in milliseconds, if any.
+        sidecars: Whether to write the peaks index and the preview.
+
+    Returns:
+        The path to the encoded audio.
+    """
+
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    out_p = Path(out_path)
+    out_p.parent.mkdir(parents=True, exist_ok=True)
+
+    data = apply_gain(data, gain_db)
+    if duration_ms is not None:
+        data = trim_to_exact(data, sr, duration_ms)
+
+    if sidecars:
+        # best-effort, the artifact is still usable without them
+        try:
+            write_peaks(peaks_path(out_p), data, sr)
+            write_preview(preview_path(out_p), data, sr)
+        except Exception as e:
+            logger.warning("Couldn't write peaks and preview for %s: %s", out_p, e)
+
+    # write next to the target and rename, so a partial file is never mistaken for a finished one
+    part_p = partial_path(out_p)
+
+    try:
+        if fmt == "wav":
+            sf_write(part_p, data, sr, subtype="PCM_16", format="WAV")
+        elif fmt == "flac":
+            sf_write(part_p, data, sr, format="FLAC")
+        elif fmt == "mp3":
+            tmpwav = temp_wav_path(out_p)
+            sf_write(tmpwav, data, sr, subtype="PCM_16", format="WAV")
+            try:
+                seg = cast(AudioSegment, AudioSegment.from_wav(tmpwav))
+                seg.export(part_p, format="mp3")
+            finally:
+                tmpwav.unlink(missing_ok=True)
+
+        part_p.replace(out_p)
+    finally:
+        part_p.unlink(missing_ok=True)
+
+    logger.info("Encoding complete -> %s", out_p)
+    return out_p
+
+
+def peaks_path(path: Path) -> Path:
+    """
+    Returns the path of the waveform peaks index for an artifact.
+    """
+
+    return path.with_name(f"{path.stem}{PEAKS_SUFFIX}")
+
+
+def preview_path(path: Path) -> Path:
+    """
+    Returns the path of the low-bitrate preview for an artifact.
+    """
+
+    return path.with_name(f"{path.stem}{PREVIEW_SUFFIX}")
+
+
+def compute_peaks(
+    data: np.ndarray,
+    sr: int,
+) -> dict:
+    """
+    Computes a multi-resolution min/max peaks index of the audio, across all channels.
+
+    The finest level keeps at most peaks_max_count peaks, and each coarser level reduces four
+    neighbouring peaks into one, until at most peaks_min_count remain. Values are scaled to -127..127.
+    """
+
+    frames = len(data)
+    samples_per_peak = max(settings.peaks_min_samples_per_peak, math.ceil(frames / settings.peaks_max_count))
+
+    # reduce the whole buckets at once through a view, so long renders are never copied, then the
+    # last bucket, which may be partial
+    count = max(math.ceil(frames / samples_per_peak), 1)
+    whole = (count - 1) * samples_per_peak
+    buckets = data[:whole].reshape(count - 1, samples_per_peak * data.shape[1])
+    last = data[whole:]
+
+    mins = np.append(buckets.min(axis=1), last.min() if len(last) else 0.0)
+    maxs = np.append(buckets.max(axis=1), last.max() if len(last) else 0.0)
+
+    levels = []
+    while True:
+        levels.append(
+            {
+                "samples_per_peak": samples_per_peak,
+                "min": _quantize(mins).tolist(),
+                "max": _quantize(maxs).tolist(),
+            }
+        )
+
+        if len(mins) <= settings.peaks_min_count:
+            break
+
+        # pad with the edge values, so padding never widens the range
+        pad = -len(mins) % 4
+        mins = np.pad(mins, (0, pad), mode="edge").reshape(-1, 4).min(axis=1)
+        maxs = np.pad(maxs, (0, pad), mode="edge").reshape(-1, 4).max(axis=1)
+        samples_per_peak *= 4
+
+    return {
+        "sample_rate": sr,
+        "channels": data.shape[1],
+        "duration_s": frames / sr,
+        "levels": levels,
+    }
+
+
+def _quantize(peaks: np.ndarray) -> np.ndarray:
+    """
+    Scales peaks to -127..127, clipping samples beyond full scale instead of wrapping around.
+    """
+
+    return np.clip(np.round(peaks * 127), -127, 127).astype(np.int8)
+
+
+def write_peaks(
+    path: Path,
+    data: np.ndarray,
+    sr: int,
+) -> None:
+    """
+    Writes the peaks index of the audio as compact JSON.
+    """
+
+    part_p = partial_path(path)
+
+    try:
+        with part_p.open("w", encoding="utf-8") as f:
+            json.dump(compute_peaks(data, sr), f, separators=(",", ":"))
+        part_p.replace(path)
+    finally:
+        part_p.unlink(missing_ok=True)
+
+
+def write_preview(
+    path: Path,
+    data: np.ndarray,
+    sr: int,
+) -> None:
+    """
+    Writes the opening of the audio as a mono low-bitrate mp3, faded out at the end.
+    """
+
+    clip = data[: int(settings.preview_duration_s * sr)].mean(axis=1)
+    tmpwav = temp_wav_path(path)
+    part_p = partial_path(path)
+
+    try:
+        sf_write(tmpwav, clip, sr, subtype="PCM_16", format="WAV")
+        seg = cast(AudioSegment, AudioSegment.from_wav(tmpwav))
+        seg = seg.fade_out(min(1000, len(seg) // 4))
+        seg.export(part_p, format="mp3", bitrate=settings.preview_bitrate)
+        part_p.replace(path)
+    finally:
+        tmpwav.unlink(missing_ok=True)
+        part_p.unlink(missing_ok=True)
+
+
+def partial_path(path: Path) -> Path:
+    """
+    Returns a temporary path an artifact is written to before being renamed into place.
+
+    The name is unique per call, so a worker still encoding a job whose lease was redelivered
+    never writes into the same file as the worker that took it over.
+    """
+
+    return path.with_name(f".{path.stem}.{uuid.uuid4().hex[:8]}.partial{path.suffix}")
+
+
+def temp_wav_path(path: Path) -> Path:
+    """
+    Returns a temporary wav path, unique per call, to convert from before encoding to mp3.
+    """
+
+    return path.with_name(f"{path.stem}.{uuid.uuid4().hex[:8]}.tmp.wav")
+
+
+def apply_gain(
+    samples: np.ndarray,
+    gain_db: float,
+) -> np.ndarray:
+    """
+    Applies gain to the audio.
+    """
+
+    if abs(gain_db) < 1e-6:
+        return samples
+    gain = 10 ** (gain_db / 20.0)
+    return np.clip(samples * gain, -1.0, 1.0)
+
+
+def trim_to_exact(
+    samples: np.ndarray,
+    sr: int,
+    target_ms: int,
+) -> np.ndarray:
+    """
+    Trims the audio to the exact duration.
+    """
+
+    exact_samples = int(round(target_ms * sr / 1000.0))
+    if len(samples) < exact_samples:
+        return samples
+    return samples[:exact_samples]
+
+
+def sf_write(
+    path: Path,
+    data: np.ndarray,
+    sr: int,
+    subtype: str | None = None,
+    format: str | None = None,
+) -> None:
+    """
+    Writes the audio to the file.
+    """
+
+    sf.write(path, data, sr, subtype=subtype, format=format)
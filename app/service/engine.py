@@ -2,14 +2,15 @@ from __future__ import annotations
 
 import logging
 import tempfile
+import threading
 from pathlib import Path
-from typing import Any, cast
+from typing import Any
 
 import numpy as np
 import soundfile as sf
-from pydub import AudioSegment
 
 from app.core.settings import settings
+from app.service.encoder import SUPPORTED_FORMATS, encode_audio
 
 try:
     from magenta_rt import audio, system
@@ -54,6 +55,14 @@ class AudioEngine:
         )
         logger.info("MagentaRT loaded successfully.")
 
+    @property
+    def is_loaded(self) -> bool:
+        """
+        Whether the MagentaRT model is loaded.
+        """
+
+        return self._model is not None
+
     def generate_music(
         self,
         prompt: str,
@@ -61,6 +70,7 @@ class AudioEngine:
         out_path: str,
         fmt: str = "wav",
         gain_db: float = 0.0,
+        abort: threading.Event | None = None,
     ) -> Path:
         """
         Generates music using the loaded MagentaRT model.
@@ -71,11 +81,39 @@ class AudioEngine:
             out_path: The path to save the generated music to.
             fmt: The format of the generated music ("wav", "flac", "mp3").
             gain_db: The gain of the generated music in decibels.
+            abort: When set, generation stops before the next chunk.
 
         Returns:
             The path to the generated music.
         """
 
+        if fmt not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+        data, sr = self.render_waveform(prompt, duration_ms, abort=abort)
+        out_p = encode_audio(data, sr, out_path, fmt=fmt, gain_db=gain_db, duration_ms=duration_ms)
+
+        logger.info("Generation complete -> %s", out_p)
+        return out_p
+
+    def render_waveform(
+        self,
+        prompt: str,
+        duration_ms: int,
+        abort: threading.Event | None = None,
+    ) -> tuple[np.ndarray, int]:
+        """
+        Runs the model for the given prompt, without any post-processing.
+
+        Args:
+            prompt: The prompt to generate music from.
+            duration_ms: The duration of the generated music in milliseconds.
+            abort: When set, generation stops before the next chunk.
+
+        Returns:
+            The rendered samples shaped (frames, channels), and their sample rate.
+        """
+
         if self._model is None:
             logger.error("MagentaRT is not loaded.")
             raise RuntimeError("MagentaRT is not loaded.")
@@ -84,9 +122,6 @@ class AudioEngine:
             logger.error("magenta_rt module is not found.")
             raise RuntimeError("magenta_rt module is not found.")
 
-        out_p = Path(out_path)
-        out_p.parent.mkdir(parents=True, exist_ok=True)
-
         duration_s = duration_ms / 1000.0
 
         # 1. Embed Style
@@ -105,77 +140,21 @@ class AudioEngine:
         logger.info("Starting generation for '%s' for %s seconds", prompt, duration_s)
 
         for _ in range(num_chunks):
+            if abort is not None and abort.is_set():
+                raise RuntimeError("Generation aborted")
+
             chunk, state = self._model.generate_chunk(state=state, style=style)
             chunks.append(chunk)
 
-        # 3. Concatenate & Process
+        # 3. Concatenate
         generated_waveform = audio.concatenate(chunks)
         generated_waveform = generated_waveform[:num_samples]
 
-        # 4. Post-process via temp file
+        # 4. Read back as plain samples via temp file
         with tempfile.TemporaryDirectory() as td:
             raw_temp_path = Path(td) / "raw_generation.wav"
             generated_waveform.write(str(raw_temp_path))
 
-            data, sr = sf.read(str(raw_temp_path), always_2d=True)
-            data = self._apply_gain(data, gain_db)
-            data = self._trim_to_exact(data, sr, duration_ms)
-
-            if fmt == "wav":
-                self._sf_write(out_p, data, sr, subtype="PCM_16")
-            elif fmt == "flac":
-                self._sf_write(out_p, data, sr, format="FLAC")
-            elif fmt == "mp3":
-                tmpwav = out_p.with_suffix(".tmp.wav")
-                self._sf_write(tmpwav, data, sr, subtype="PCM_16")
-                seg = cast(AudioSegment, AudioSegment.from_wav(tmpwav))
-                seg.export(out_p, format="mp3")
-                tmpwav.unlink()
-            else:
-                raise ValueError(f"Unsupported format: {fmt}")
-
-        logger.info("Generation complete -> %s", out_p)
-        return out_p
-
-    @staticmethod
-    def _apply_gain(
-        samples: np.ndarray,
-        gain_db: float,
-    ) -> np.ndarray:
-        """
-        Applies gain to the audio.
-        """
-
-        if abs(gain_db) < 1e-6:
-            return samples
-        gain = 10 ** (gain_db / 20.0)
-        return np.clip(samples * gain, -1.0, 1.0)
-
-    @staticmethod
-    def _trim_to_exact(
-        samples: np.ndarray,
-        sr: int,
-        target_ms: int,
-    ) -> np.ndarray:
-        """
-        Trims the audio to the exact duration.
-        """
-
-        exact_samples = int(round(target_ms * sr / 1000.0))
-        if len(samples) < exact_samples:
-            return samples
-        return samples[:exact_samples]
-
-    @staticmethod
-    def _sf_write(
-        path: Path,
-        data: np.ndarray,
-        sr: int,
-        subtype: str | None = None,
-        format: str | None = None,
-    ) -> None:
-        """
-        Writes the audio to the file.
-        """
+            data, sr = sf.read(str(raw_temp_path), always_2d=True, dtype="float32")
 
-        sf.write(path, data, sr, subtype=subtype, format=format)
+        return data, sr
@@ -3,14 +3,23 @@ from __future__ import annotations
 import asyncio
 import contextlib
 import logging
-import re
+import os
+import socket
+import threading
 import uuid
+from datetime import UTC, datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
 from uuid import UUID
 
 from app.core.settings import settings
+from app.core.utils import slugify
 from app.schemas.job_schema import Job, JobAcknowledgment, JobRequest, JobStatus
-from app.service.engine import AudioEngine
+from app.service.artifact_store import ArtifactStore
+from app.service.broker import Broker, create_broker
+
+if TYPE_CHECKING:
+    from app.service.engine import AudioEngine
 
 logger = logging.getLogger(__name__)
 
@@ -25,19 +34,48 @@ class JobManager:
         return cls._instance
 
     def _init(self) -> None:
-        self.jobs: dict[UUID, Job] = {}
-        self.queue: asyncio.Queue[UUID] = asyncio.Queue(maxsize=settings.max_queue_size)
-        self.engine = AudioEngine()
+        self.broker: Broker = create_broker()
+        self.artifacts = ArtifactStore(self.broker)
+        self.engine: AudioEngine | None = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
         self.worker_task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+
+    async def start(self) -> None:
+        """
+        Starts the artifact store and, if enabled, the background worker.
+        Artifacts are only swept by processes running a worker.
+        """
+
+        await self.artifacts.start(sweep=settings.worker_enabled)
+        await self.start_worker()
+
+    async def stop(self) -> None:
+        """
+        Stops the background worker and the artifact store.
+        """
+
+        await self.stop_worker()
+        await self.artifacts.stop()
+        await asyncio.to_thread(self.broker.close)
 
     async def start_worker(self) -> None:
         """
         Starts the background worker.
         """
-        logger.info("Starting background worker")
 
+        if not settings.worker_enabled:
+            logger.info("Worker disabled, jobs are only accepted by this process")
+            return
+
+        logger.info("Starting background worker with id=%s", self.worker_id)
+
+        # imported here, so API processes without a worker never load MagentaRT and its dependencies
+        from app.service.engine import AudioEngine
+
+        self.engine = AudioEngine()
         await asyncio.to_thread(self.engine.load_magenta_rt_in_memory)
-        self.worker_task = asyncio.create_task(self._worker())
+        self.worker_task = asyncio.create_task(self._worker(self.engine))
         logger.info("Background worker started.")
 
     async def stop_worker(self) -> None:
@@ -51,40 +89,50 @@ class JobManager:
             with contextlib.suppress(asyncio.CancelledError):
                 await self.worker_task
 
-    async def submit_job(self, request: JobRequest) -> JobAcknowledgment:
+    async def submit_job(self, request: JobRequest, client_id: str | None = None) -> JobAcknowledgment:
         """
         Submits a job.
-        Raises asyncio.QueueFull if queue is full.
+        Raises AdmissionRejected if the queue can't take it.
         """
         job = Job.from_request(job_id=uuid.uuid4(), request=request)
         logger.info("Creating job with id=%s", job.id)
         logger.info("Job details: %s", job)
 
-        # this raises QueueFull immediately if the queue is full
-        self.queue.put_nowait(job.id)
+        await asyncio.to_thread(self.broker.put, job, client_id)
+
+        self._wakeup.set()
 
-        self.jobs[job.id] = job
         logger.info("Job submitted with id=%s", job.id)
         return job.to_acknowledgment()
 
-    def get_job(self, job_id: UUID) -> Job | None:
+    async def list_jobs(self, status: JobStatus | None = None) -> list[Job]:
+        """
+        Lists jobs, optionally filtered by status.
+        """
+
+        return await asyncio.to_thread(self.broker.list_jobs, status)
+
+    async def get_job(self, job_id: UUID) -> Job | None:
         """
         Retrieves a job by ID.
         """
         logger.info("Get job by id=%s", job_id)
 
-        return self.jobs.get(job_id)
+        return await asyncio.to_thread(self.broker.get, job_id)
 
-    def get_file_path_for_job(self, job_id: UUID) -> Path:
+    async def get_file_path_for_job(self, job_id: UUID) -> Path:
         """
         Retrieves the file path for a given job.
         """
 
-        job = self.get_job(job_id)
+        job = await self.get_job(job_id)
 
         if job is None:
             logger.error("Job not found with id=%s", job_id)
             raise KeyError("Job not found")
+        if job.status == JobStatus.EXPIRED:
+            logger.error("Output file for job id=%s has expired", job_id)
+            raise FileNotFoundError(f"Output file for job id={job_id} has expired")
         if job.status != JobStatus.COMPLETED:
             logger.error("Job with id=%s isn't completed yet", job_id)
             raise ValueError("Job isn't completed yet")
@@ -96,30 +144,45 @@ class JobManager:
         logger.info(f"Retrieve file path for job id={job_id}: {path}")
         return path
 
-    def cancel_job(self, job_id: UUID) -> None:
+    async def mark_downloaded(self, job_id: UUID) -> None:
+        """
+        Records a download of a job's artifact, which keeps it from being evicted.
+        """
+
+        job = await self.get_job(job_id)
+
+        if job is None or job.status != JobStatus.COMPLETED:
+            return
+
+        now = datetime.now(UTC)
+
+        # range requests come in bursts, one write per interval is enough for eviction
+        if job.downloaded_at and (now - job.downloaded_at).total_seconds() < settings.artifact_touch_interval_s:
+            return
+
+        await asyncio.to_thread(self.broker.touch, job_id, now)
+
+    async def cancel_job(self, job_id: UUID) -> None:
         """
         Cancel a job by its ID.
         """
         logger.info("Cancel job by id=%s", job_id)
 
-        job = self.get_job(job_id)
+        job = await self.get_job(job_id)
 
         if job is None:
             raise KeyError("Job not found")
 
-        if job.status == JobStatus.PROCESSING:
+        if job.status == JobStatus.PROCESSING or not await asyncio.to_thread(self.broker.delete, job_id):
             raise ValueError("Cannot cancel a processing job")
 
-        # best-effort artifact cleanup
+        # artifact cleanup happens in the background
         if job.output_name:
-            path = Path(settings.output_dir) / job.output_name
-            if path.exists():
-                path.unlink()
+            self.artifacts.discard(job.output_name)
 
-        del self.jobs[job_id]
         logger.info("Cancelled and removed job id=%s", job_id)
 
-    def clear_jobs(self, status: JobStatus | None = None) -> int:
+    async def clear_jobs(self, status: JobStatus | None = None) -> int:
         """
         Clear jobs by status.
         """
@@ -127,74 +190,42 @@ class JobManager:
 
         removed = 0
 
-        for job_id, job in list(self.jobs.items()):
+        for job in await self.list_jobs(status):
             if job.status == JobStatus.PROCESSING:
                 # skip processing jobs
                 continue
 
-            if status is None or job.status == status:
-                # best-effort artifact cleanup
-                if job.output_name:
-                    path = Path(settings.output_dir) / job.output_name
-                    if path.exists():
-                        path.unlink()
+            if not await asyncio.to_thread(self.broker.delete, job.id):
+                # picked up by a worker in the meantime
+                continue
+
+            # artifact cleanup happens in the background
+            if job.output_name:
+                self.artifacts.discard(job.output_name)
 
-                del self.jobs[job_id]
-                removed += 1
+            removed += 1
 
         logger.warning("Removed %d jobs", removed)
         return removed
 
-    async def _worker(self) -> None:
+    async def _worker(self, engine: AudioEngine) -> None:
         """
-        Infinite loop processing jobs from the queue.
+        Infinite loop leasing jobs from the broker.
         """
 
         logger.info("Starting worker loop")
         while True:
             try:
-                job_id = await self.queue.get()
-                job = self.jobs.get(job_id)
+                self._wakeup.clear()
+                job = await asyncio.to_thread(self.broker.lease, self.worker_id)
 
                 if job is None:
-                    logger.info("Skipping cancelled job id=%s", job_id)
-                    self.queue.task_done()
+                    # submissions on this node wake the worker up, other nodes are polled
+                    with contextlib.suppress(TimeoutError):
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=settings.broker_poll_interval_s)
                     continue
 
-                job.status = JobStatus.PROCESSING
-                logger.info("Processing job with id=%s", job_id)
-
-                try:
-                    # prepare output path
-                    slug = self._slugify(job.prompt)
-
-                    # use string representation of UUID for filename
-                    filename = f"{slug}-{str(job_id)[:8]}.{job.format}"
-                    out_path = Path(settings.output_dir) / filename
-
-                    # update the job with output path
-                    job.output_name = filename
-
-                    # run blocking engine in a separate thread
-                    await asyncio.to_thread(
-                        self.engine.generate_music,
-                        prompt=job.prompt.strip(),
-                        duration_ms=int(job.duration_s * 1000),
-                        out_path=str(out_path),
-                        fmt=job.format,
-                        gain_db=job.gain_db,
-                    )
-
-                    job.output_name = filename
-                    job.status = JobStatus.COMPLETED
-                    logger.info("Job with id=%s COMPLETED", job_id)
-
-                except Exception as e:
-                    logger.error("Job with id=%s FAILED: %s", job_id, e)
-                    job.status = JobStatus.FAILED
-                    job.message = str(e)
-                finally:
-                    self.queue.task_done()
+                await self._process(job, engine)
 
             except asyncio.CancelledError:
                 break
@@ -202,13 +233,73 @@ class JobManager:
                 logger.error(f"Unexpected worker error: {e}")
                 await asyncio.sleep(5)
 
-    @staticmethod
-    def _slugify(text: str) -> str:
+    async def _process(self, job: Job, engine: AudioEngine) -> None:
         """
-        Creates a URL-friendly slug of max length 50 from the given text.
+        Generates the audio for a leased job, keeping the lease alive meanwhile.
         """
 
-        text = text.lower()
-        text = re.sub(r"[^a-z0-9]+", "-", text)
-        max_len = settings.filename_trim_length
-        return text.strip("-")[:max_len]
+        logger.info("Processing job with id=%s", job.id)
+
+        # set when the lease is lost or the worker stops, so the model stops generating for nothing
+        abort = threading.Event()
+        heartbeat_task = asyncio.create_task(self._heartbeat(job.id, abort))
+
+        try:
+            # prepare output path
+            slug = slugify(job.prompt)
+
+            # use string representation of UUID for filename
+            filename = f"{slug}-{str(job.id)[:8]}.{job.format}"
+            out_path = Path(settings.output_dir) / filename
+
+            # run blocking engine in a separate thread
+            await asyncio.to_thread(
+                engine.generate_music,
+                prompt=job.prompt.strip(),
+                duration_ms=int(job.duration_s * 1000),
+                out_path=str(out_path),
+                fmt=job.format,
+                gain_db=job.gain_db,
+                abort=abort,
+            )
+
+            job.output_name = filename
+            job.status = JobStatus.COMPLETED
+            job.completed_at = datetime.now(UTC)
+            logger.info("Job with id=%s COMPLETED", job.id)
+
+        except asyncio.CancelledError:
+            abort.set()
+            # hand the job back, so another worker picks it up without waiting for the lease to expire
+            await asyncio.to_thread(self.broker.requeue, job.id, self.worker_id)
+            raise
+        except Exception as e:
+            if abort.is_set():
+                logger.warning("Abandoned job id=%s after losing its lease", job.id)
+                return
+
+            logger.error("Job with id=%s FAILED: %s", job.id, e)
+            job.status = JobStatus.FAILED
+            job.message = str(e)
+            job.completed_at = datetime.now(UTC)
+        finally:
+            heartbeat_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await heartbeat_task
+
+        if not await asyncio.to_thread(self.broker.finish, job, self.worker_id):
+            logger.warning("Lease on job id=%s was lost, discarding result", job.id)
+
+    async def _heartbeat(self, job_id: UUID, abort: threading.Event) -> None:
+        """
+        Renews the lease on a job until cancelled.
+        Once the lease is lost, another worker owns the job, so generation is aborted.
+        """
+
+        while True:
+            await asyncio.sleep(settings.broker_heartbeat_s)
+
+            if not await asyncio.to_thread(self.broker.heartbeat, job_id, self.worker_id):
+                logger.warning("Lost lease on job id=%s, aborting its generation", job_id)
+                abort.set()
+                return
@@ -117,10 +117,20 @@ function renderActions(job) {
     `;
   }
 
-  // completed -> download + delete
+  // completed -> preview + download + delete
   if (job.status === "COMPLETED") {
+    const previewing = previewJobId === job.id;
+
     return `
       <div class="action-buttons">
+        <button
+          class="btn btn-sm btn-outline-secondary"
+          title="${previewing ? "Stop preview" : "Play preview"}"
+          onclick="togglePreview('${job.id}')"
+        >
+          <i class="bi ${previewing ? "bi-stop-fill" : "bi-play-fill"}"></i>
+        </button>
+
         <a
           class="btn btn-sm btn-outline-primary"
           href="${API_BASE}/jobs/${job.id}/download"
@@ -140,12 +150,12 @@ function renderActions(job) {
     `;
   }
 
-  // failed -> delete
-  if (job.status === "FAILED") {
+  // failed or expired -> delete
+  if (job.status === "FAILED" || job.status === "EXPIRED") {
     return `
       <button
         class="btn btn-sm btn-outline-danger"
-        title="Delete failed job"
+        title="Delete ${job.status.toLowerCase()} job"
         onclick="cancelJob('${job.id}')"
       >
         <i class="bi bi-trash"></i>
@@ -188,6 +198,12 @@ els.form.addEventListener("submit", async (e) => {
       body: JSON.stringify(payload),
     });
 
+    if (res.status === 429) {
+      const retryAfter = Number(res.headers.get("Retry-After"));
+      showToast(`Queue is busy, try again in ${formatDuration(retryAfter)}`);
+      return;
+    }
+
     if (!res.ok) {
       showToast("Failed to queue job");
       throw new Error();
@@ -244,6 +260,33 @@ window.cancelJob = async (id) => {
   fetchJobs();
 };
 
+// -------------------------
+let previewJobId = null;
+const previewAudio = new Audio();
+
+previewAudio.addEventListener("ended", () => {
+  previewJobId = null;
+  fetchJobs();
+});
+
+window.togglePreview = (id) => {
+  previewAudio.pause();
+
+  if (previewJobId === id) {
+    previewJobId = null;
+  } else {
+    previewJobId = id;
+    previewAudio.src = `${API_BASE}/jobs/${id}/preview`;
+    previewAudio.play().catch(() => {
+      previewJobId = null;
+      showToast("Preview not available");
+      fetchJobs();
+    });
+  }
+
+  fetchJobs();
+};
+
 // -------------------------
 function setLoading(state) {
   const spinner = els.submitBtn.querySelector(".spinner-border");
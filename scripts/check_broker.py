@@ -0,0 +1,203 @@
+"""
+Checks the sqlite broker with several local processes sharing one database.
+
+    python -m scripts.check_broker --jobs 200 --workers 4
+
+Verifies that every job is leased exactly once, that a job whose worker dies is redelivered once
+its lease expires, and that it's failed once it runs out of attempts.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from collections.abc import Callable
+from multiprocessing.context import SpawnContext
+from multiprocessing.queues import Queue
+from multiprocessing.synchronize import Barrier
+from pathlib import Path
+from uuid import UUID
+
+from app.core.settings import settings
+from app.schemas.job_schema import Job, JobRequest, JobStatus
+from app.service.broker import SQLiteBroker
+
+LEASE_S = 0.5
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=200, help="Number of jobs to lease across the workers.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes.")
+    args = parser.parse_args()
+
+    mp_context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "jobs.sqlite3"
+        results = [
+            _check("lease once", _check_lease_once(mp_context, db.with_stem("lease-once"), args.jobs, args.workers)),
+            _check("redelivery", _check_redelivery(mp_context, db.with_stem("redelivery"))),
+            _check("max attempts", _check_max_attempts(mp_context, db.with_stem("max-attempts"))),
+        ]
+
+    sys.exit(0 if all(results) else 1)
+
+
+def _check(name: str, errors: list[str]) -> bool:
+    for error in errors:
+        print(f"FAIL {name}: {error}")
+
+    if not errors:
+        print(f"OK   {name}")
+
+    return not errors
+
+
+def _check_lease_once(mp_context: SpawnContext, db: Path, jobs: int, workers: int) -> list[str]:
+    """
+    Several workers drain the same queue, and no job may be handed out twice.
+    """
+
+    ids = _submit(db, jobs)
+
+    # every worker starts leasing at the same time, so they contend for the same jobs
+    barrier = mp_context.Barrier(workers)
+    results: Queue[list[str]] = mp_context.Queue()
+    processes = [mp_context.Process(target=_drain, args=(db, barrier, results)) for _ in range(workers)]
+
+    for process in processes:
+        process.start()
+
+    batches = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    print(f"     leased per worker: {[len(batch) for batch in batches]}")
+    leased = [UUID(job_id) for batch in batches for job_id in batch]
+
+    errors = [f"job id={job_id} leased {n} times" for job_id, n in Counter(leased).items() if n > 1]
+    errors += [f"job id={job_id} never leased" for job_id in set(ids) - set(leased)]
+
+    broker = _open(db)
+    errors += [f"job id={job.id} ended {job.status}" for job in broker.list_jobs() if job.status != JobStatus.COMPLETED]
+    broker.close()
+
+    return errors
+
+
+def _check_redelivery(mp_context: SpawnContext, db: Path) -> list[str]:
+    """
+    A worker dies holding a lease, and another worker gets the job once the lease expires.
+    """
+
+    (job_id,) = _submit(db, 1)
+
+    _run(mp_context, _lease_and_die, db)
+
+    broker = _open(db)
+    errors = []
+
+    if broker.lease("early") is not None:
+        errors.append("job redelivered before its lease expired")
+
+    time.sleep(LEASE_S * 2)
+    job = broker.lease("survivor")
+
+    if job is None or job.id != job_id:
+        errors.append("job not redelivered after its lease expired")
+    else:
+        job.status = JobStatus.COMPLETED
+        if not broker.finish(job, "survivor"):
+            errors.append("redelivered job couldn't be finished")
+
+    broker.close()
+    return errors
+
+
+def _check_max_attempts(mp_context: SpawnContext, db: Path) -> list[str]:
+    """
+    Every worker dies holding the lease, and the job is failed after broker_max_attempts.
+    """
+
+    (job_id,) = _submit(db, 1)
+
+    for _ in range(settings.broker_max_attempts):
+        _run(mp_context, _lease_and_die, db)
+        time.sleep(LEASE_S * 2)
+
+    broker = _open(db)
+    errors = []
+
+    if broker.lease("late") is not None:
+        errors.append("job redelivered after running out of attempts")
+
+    job = broker.get(job_id)
+    if job is None or job.status != JobStatus.FAILED or job.completed_at is None:
+        errors.append(f"job ended {job.status if job else 'missing'}, expected {JobStatus.FAILED} with completed_at")
+
+    broker.close()
+    return errors
+
+
+def _open(db: Path) -> SQLiteBroker:
+    settings.broker_lease_s = LEASE_S
+    settings.max_queue_size = sys.maxsize
+    return SQLiteBroker(db)
+
+
+def _submit(db: Path, count: int) -> list[UUID]:
+    broker = _open(db)
+    jobs = [Job.from_request(uuid.uuid4(), JobRequest(prompt=f"check {i}", duration_s=1)) for i in range(count)]
+
+    for job in jobs:
+        broker.put(job)
+
+    broker.close()
+    return [job.id for job in jobs]
+
+
+def _run(mp_context: SpawnContext, target: Callable[[Path], None], db: Path) -> None:
+    process = mp_context.Process(target=target, args=(db,))
+    process.start()
+    process.join()
+
+
+def _drain(db: Path, barrier: Barrier, results: Queue[list[str]]) -> None:
+    """
+    Leases and completes jobs until none are left, reporting the IDs it got.
+    """
+
+    broker = _open(db)
+    worker_id = f"check:{os.getpid()}"
+    leased = []
+
+    barrier.wait()
+
+    while (job := broker.lease(worker_id)) is not None:
+        leased.append(str(job.id))
+        job.status = JobStatus.COMPLETED
+        broker.finish(job, worker_id)
+
+    broker.close()
+    results.put(leased)
+
+
+def _lease_and_die(db: Path) -> None:
+    """
+    Leases a job and exits without finishing it or releasing the lease.
+    """
+
+    broker = _open(db)
+    broker.lease(f"check:{os.getpid()}")
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()